@@ -7,16 +7,84 @@ AI-powered browser automation using Claude.
 
 import argparse
 import asyncio
+import concurrent.futures
+import importlib
 import json
 import os
 import sys
+import threading
+import time
 from pathlib import Path
 
+DEFAULT_MODEL = "claude-sonnet-4-0"
+DEFAULT_TIMEOUT = 300
+
+# Keymanager lookups spawn bun, so keep the resolved key around for a day.
+# The cache is dropped when the API rejects the key; delete it by hand after rotating a key.
+KEY_CACHE_PATH = os.path.expanduser("~/.cache/navi/anthropic.key")
+KEY_CACHE_TTL = 86400
+
+
+def _load_cached_key(path):
+    try:
+        if os.stat(path).st_mtime < time.time() - KEY_CACHE_TTL:
+            return None
+        with open(path) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _save_cached_key(path, key):
+    try:
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            # The mode above only applies on creation; tighten a pre-existing file too
+            os.fchmod(fd, 0o600)
+            os.write(fd, key.encode())
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+
+def _drop_cached_key():
+    """Delete the cache, but only if it holds the key this run authenticated with."""
+    try:
+        with open(KEY_CACHE_PATH) as f:
+            if f.read().strip() != os.environ.get("ANTHROPIC_API_KEY"):
+                return
+        os.remove(KEY_CACHE_PATH)
+    except OSError:
+        pass
+
+
+def _invalidate_cached_key(error):
+    """Drop the cached key if the API rejected it, so the next run asks keymanager again."""
+    while error is not None:
+        if getattr(error, "status_code", None) == 401:
+            _drop_cached_key()
+            return
+        error = error.__cause__
+
+
+def _invalidate_cached_key_from_history(history):
+    """Same as _invalidate_cached_key, for LLM errors the agent recorded instead of raising."""
+    errors = history.errors() if hasattr(history, "errors") else []
+    if any(err and ("authentication_error" in err or "Error code: 401" in err) for err in errors):
+        _drop_cached_key()
+
+
 # Try to get API key from keymanager if not in environment
 def get_anthropic_api_key():
     if os.environ.get("ANTHROPIC_API_KEY"):
         return os.environ["ANTHROPIC_API_KEY"]
 
+    cached = _load_cached_key(KEY_CACHE_PATH)
+    if cached:
+        return cached
+
     # Try keymanager
     try:
         import subprocess
@@ -31,6 +99,7 @@ def get_anthropic_api_key():
                 if line.startswith("Key:"):
                     key = line.split(":", 1)[1].strip()
                     if key and not key.startswith("***"):
+                        _save_cached_key(KEY_CACHE_PATH, key)
                         return key
     except Exception:
         pass
@@ -38,56 +107,147 @@ def get_anthropic_api_key():
     return None
 
 
+def build_task(task: str, url: str | None = None) -> str:
+    """Prefix the task with a navigation step when a starting URL is given."""
+    if url:
+        return f"First navigate to {url}, then: {task}"
+    return task
+
+
+def print_result(task: str, url: str | None, result, output_format: str = "text", json_lines: bool = False):
+    """Render a task result in the requested output format.
+
+    With ``json_lines`` the JSON object is printed on a single line, so multi-task runs stay parseable.
+    """
+    if output_format == "json":
+        output = {
+            "success": True,
+            "task": task,
+            "url": url,
+            "result": result,
+        }
+        print(json.dumps(output, indent=None if json_lines else 2))
+    elif output_format == "markdown":
+        print(f"## Browser Task Result\n")
+        print(f"**Task:** {task}\n")
+        if url:
+            print(f"**URL:** {url}\n")
+        print(f"**Result:**\n\n{result}")
+    else:
+        print(result)
+
+
+def print_error(error_msg: str, output_format: str = "text"):
+    """Report an error on stdout as JSON, or on stderr otherwise."""
+    if output_format == "json":
+        print(json.dumps({"success": False, "error": error_msg}), flush=True)
+    else:
+        print(f"Error: {error_msg}", file=sys.stderr, flush=True)
+
+
+# Extra seconds past --timeout before the watchdog stops waiting for asyncio cancellation
+KILL_GRACE = 10
+
+
+def _hard_timeout(loop, browser, timeout, output_format):
+    """Watchdog for agents that ignore cancellation, e.g. stuck in a blocking call."""
+    future = asyncio.run_coroutine_threadsafe(browser.kill(), loop)
+    try:
+        future.result(timeout=KILL_GRACE)
+        return
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+    except Exception as e:
+        # The loop is alive and ran kill(); let the task's own error handling finish the job
+        print(f"Warning: failed to kill browser after timeout: {e}", file=sys.stderr)
+        return
+
+    # The event loop itself is wedged; nothing async can run, so exit the process
+    print_error(f"Task timed out after {timeout} seconds", output_format)
+    os._exit(1)
+
+
 async def run_browser_task(
     task: str,
     url: str | None = None,
     headless: bool = False,
     screenshot_path: str | None = None,
     output_format: str = "text",
-    timeout: int = 300,
-    model: str = "claude-sonnet-4-0",
+    timeout: int = DEFAULT_TIMEOUT,
+    model: str = DEFAULT_MODEL,
     debug: bool = False,
+    latency_optimized: bool = False,
+    browser=None,
+    json_lines: bool = False,
 ):
-    """Run a browser automation task using browser-use."""
+    """Run a browser automation task using browser-use.
 
-    # Import here to avoid slow startup for --help
-    from browser_use import Agent, Browser, ChatAnthropic
+    Pass an already-started ``browser`` to reuse it; it is left open for the caller to close.
+    Shared browsers get no watchdog: killing the session or the process would take every other
+    task down with it, so those runs rely on asyncio cancellation alone to enforce ``timeout``.
+    """
 
-    # Set up API key
-    api_key = get_anthropic_api_key()
-    if not api_key:
-        print("Error: ANTHROPIC_API_KEY not found.", file=sys.stderr)
-        print("Set it via environment variable or add to keymanager.", file=sys.stderr)
-        sys.exit(1)
-
-    os.environ["ANTHROPIC_API_KEY"] = api_key
+    # Import lazily so --help and error paths don't pay for playwright/pydantic
+    browser_use = importlib.import_module("browser_use")
+    Agent, Browser, ChatAnthropic = browser_use.Agent, browser_use.Browser, browser_use.ChatAnthropic
 
     # Configure browser
-    browser = Browser(
-        headless=headless,
-    )
+    owns_browser = browser is None
+    if owns_browser:
+        # keep_alive stops agent.run() from closing the session, so the final page can
+        # still be captured; the finally block below kills it instead
+        browser = Browser(
+            headless=headless,
+            keep_alive=True,
+        )
 
-    # Configure LLM - use browser-use's ChatAnthropic
+    # Configure LLM - use browser-use's ChatAnthropic. The agent already sends its
+    # system prompt with cache_control, so the stable prefix is cached per step.
     llm = ChatAnthropic(
         model=model,
     )
 
     # Build task with URL if provided
-    full_task = task
-    if url:
-        full_task = f"First navigate to {url}, then: {task}"
+    full_task = build_task(task, url)
 
     if debug:
         print(f"Task: {full_task}", file=sys.stderr)
         print(f"Model: {model}", file=sys.stderr)
         print(f"Headless: {headless}", file=sys.stderr)
+        print(f"Latency optimized: {latency_optimized}", file=sys.stderr)
 
     # Create agent
-    agent = Agent(
-        task=full_task,
-        llm=llm,
-        browser=browser,
-    )
+    agent_kwargs = {}
+    if latency_optimized:
+        # flash_mode skips the thinking/evaluation fields, cutting output tokens per step
+        agent_kwargs["flash_mode"] = True
+    try:
+        agent = Agent(
+            task=full_task,
+            llm=llm,
+            browser=browser,
+            **agent_kwargs,
+        )
+    except TypeError:
+        # Only retry when our optional kwargs are what this browser-use version rejected
+        if not agent_kwargs:
+            raise
+        print("Warning: latency-optimized mode not supported, using defaults", file=sys.stderr)
+        agent = Agent(
+            task=full_task,
+            llm=llm,
+            browser=browser,
+        )
+
+    watchdog = None
+    if owns_browser:
+        watchdog = threading.Timer(
+            timeout + KILL_GRACE,
+            _hard_timeout,
+            args=(asyncio.get_running_loop(), browser, timeout, output_format),
+        )
+        watchdog.daemon = True
+        watchdog.start()
 
     try:
         # Run the task
@@ -96,68 +256,186 @@ async def run_browser_task(
             timeout=timeout
         )
 
+        # The agent swallows LLM errors into the history, so a rejected key shows up here
+        _invalidate_cached_key_from_history(history)
+
         # Get the result
         result = history.final_result() if hasattr(history, 'final_result') else str(history)
 
         # Take screenshot if requested
         if screenshot_path:
             try:
-                # Get the browser context and take screenshot
-                if hasattr(browser, 'context') and browser.context:
-                    pages = browser.context.pages
-                    if pages:
-                        await pages[0].screenshot(path=screenshot_path)
-                        if debug:
-                            print(f"Screenshot saved to: {screenshot_path}", file=sys.stderr)
+                await browser.take_screenshot(path=screenshot_path)
+                if debug:
+                    print(f"Screenshot saved to: {screenshot_path}", file=sys.stderr)
             except Exception as e:
                 print(f"Warning: Failed to save screenshot: {e}", file=sys.stderr)
 
         # Format output
-        if output_format == "json":
-            output = {
-                "success": True,
-                "task": task,
-                "url": url,
-                "result": result,
-            }
-            print(json.dumps(output, indent=2))
-        elif output_format == "markdown":
-            print(f"## Browser Task Result\n")
-            print(f"**Task:** {task}\n")
-            if url:
-                print(f"**URL:** {url}\n")
-            print(f"**Result:**\n\n{result}")
-        else:
-            print(result)
+        print_result(task, url, result, output_format, json_lines=json_lines)
 
         return True
 
     except asyncio.TimeoutError:
-        error_msg = f"Task timed out after {timeout} seconds"
-        if output_format == "json":
-            print(json.dumps({"success": False, "error": error_msg}))
-        else:
-            print(f"Error: {error_msg}", file=sys.stderr)
+        print_error(f"Task timed out after {timeout} seconds", output_format)
         return False
 
     except Exception as e:
-        error_msg = str(e)
-        if output_format == "json":
-            print(json.dumps({"success": False, "error": error_msg}))
-        else:
-            print(f"Error: {error_msg}", file=sys.stderr)
+        _invalidate_cached_key(e)
+        print_error(str(e), output_format)
         if debug:
             import traceback
             traceback.print_exc()
         return False
 
     finally:
+        if watchdog:
+            watchdog.cancel()
+
         # Clean up
+        if owns_browser:
+            try:
+                await browser.kill()
+            except Exception:
+                pass
+
+
+async def run_stdin_tasks(
+    tasks: list[str],
+    headless: bool = False,
+    screenshot_path: str | None = None,
+    **task_kwargs,
+):
+    """Run tasks one after another against a single long-lived browser.
+
+    JSON output is one object per line, and screenshots get a per-task suffix (result-0.png, ...).
+    """
+
+    browser_use = importlib.import_module("browser_use")
+
+    # keep_alive stops each agent from tearing the shared browser down when it finishes
+    browser = browser_use.Browser(
+        headless=headless,
+        keep_alive=True,
+    )
+
+    results = []
+    try:
+        for i, task in enumerate(tasks):
+            task_screenshot = None
+            if screenshot_path:
+                path = Path(screenshot_path)
+                task_screenshot = str(path.with_name(f"{path.stem}-{i}{path.suffix}"))
+            results.append(await run_browser_task(
+                task=task,
+                headless=headless,
+                screenshot_path=task_screenshot,
+                browser=browser,
+                json_lines=True,
+                **task_kwargs,
+            ))
+    finally:
         try:
-            await browser.close()
+            await browser.kill()
         except Exception:
             pass
 
+    return all(results)
+
+
+# Output token cap for each batched request (the Messages API requires max_tokens)
+BATCH_MAX_TOKENS = 4096
+
+
+def print_batch_result(batch_id: str, custom_id: str, result: str | None, error: str | None = None,
+                       output_format: str = "text"):
+    """Render one batch entry; custom_id is task-N for the Nth submitted task."""
+    if output_format == "json":
+        output = {"success": error is None, "batch_id": batch_id, "custom_id": custom_id}
+        if error is None:
+            output["result"] = result
+        else:
+            output["error"] = error
+        print(json.dumps(output))
+    elif error is not None:
+        print(f"Error: {custom_id}: {error}", file=sys.stderr)
+    elif output_format == "markdown":
+        print(f"## Batch Result: {custom_id}\n")
+        print(f"**Batch:** {batch_id}\n")
+        print(f"**Result:**\n\n{result}\n")
+    else:
+        print(f"[{custom_id}]")
+        print(result)
+
+
+def submit_batch(tasks: list[str], model: str, output_format: str = "text"):
+    """Submit tasks to the Message Batches API as plain prompts and print the batch id.
+
+    Batched requests run without a browser; use this for tasks the model can answer directly.
+    """
+    anthropic = importlib.import_module("anthropic")
+
+    try:
+        batch = anthropic.Anthropic().messages.batches.create(requests=[
+            {
+                "custom_id": f"task-{i}",
+                "params": {
+                    "model": model,
+                    "max_tokens": BATCH_MAX_TOKENS,
+                    "messages": [{"role": "user", "content": task}],
+                },
+            }
+            for i, task in enumerate(tasks)
+        ])
+    except Exception as e:
+        _invalidate_cached_key(e)
+        print_error(str(e), output_format)
+        return False
+
+    if output_format == "json":
+        print(json.dumps({"success": True, "batch_id": batch.id, "status": batch.processing_status}, indent=2))
+    else:
+        print(batch.id)
+    return True
+
+
+def poll_batch(batch_id: str, output_format: str = "text"):
+    """Print the results of a finished batch, one task at a time (JSON output is one object per line)."""
+    anthropic = importlib.import_module("anthropic")
+    client = anthropic.Anthropic()
+
+    try:
+        batch = client.messages.batches.retrieve(batch_id)
+        if batch.processing_status != "ended":
+            if output_format == "json":
+                print(json.dumps({"success": False, "batch_id": batch_id, "status": batch.processing_status}))
+            else:
+                print(f"Batch {batch_id} is still {batch.processing_status}", file=sys.stderr)
+            return False
+
+        success = True
+        for entry in client.messages.batches.results(batch_id):
+            if entry.result.type == "succeeded":
+                result = "".join(
+                    block.text for block in entry.result.message.content if block.type == "text"
+                )
+                print_batch_result(batch_id, entry.custom_id, result, output_format=output_format)
+            else:
+                # Only errored entries carry a cause; canceled/expired are reported by type
+                if entry.result.type == "errored":
+                    error = entry.result.error.error.message
+                else:
+                    error = entry.result.type
+                print_batch_result(batch_id, entry.custom_id, None, error=error,
+                                   output_format=output_format)
+                success = False
+        return success
+
+    except Exception as e:
+        _invalidate_cached_key(e)
+        print_error(str(e), output_format)
+        return False
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -169,14 +447,36 @@ Examples:
   %(prog)s "Get the current Bitcoin price" --output json
   %(prog)s "Fill out the contact form" --url "https://example.com/contact"
   %(prog)s "Sign up for an account" --url "https://service.com" --screenshot /tmp/result.png
+  %(prog)s --stdin --headless < tasks.txt
+  %(prog)s "Summarize the HTTP/3 spec" --async-submit
+  %(prog)s --async-poll msgbatch_... --output json
         """
     )
 
     parser.add_argument(
         "task",
+        nargs="?",
         help="The task to perform (natural language description)"
     )
 
+    parser.add_argument(
+        "--stdin",
+        action="store_true",
+        help="Read tasks from stdin, one per line, and run them in a single browser"
+    )
+
+    parser.add_argument(
+        "--async-submit",
+        action="store_true",
+        help="Submit the task(s) to the Message Batches API without a browser and print the batch id"
+    )
+
+    parser.add_argument(
+        "--async-poll",
+        metavar="BATCH_ID",
+        help="Print the results of a batch created with --async-submit"
+    )
+
     parser.add_argument(
         "--url",
         help="Starting URL (default: browser will search/navigate as needed)"
@@ -204,16 +504,20 @@ Examples:
     parser.add_argument(
         "--timeout",
         type=int,
-        default=300,
         help="Maximum time in seconds for the task (default: 300)"
     )
 
     parser.add_argument(
         "--model",
-        default="claude-sonnet-4-0",
         help="Claude model to use (default: claude-sonnet-4-0)"
     )
 
+    parser.add_argument(
+        "--latency-optimized",
+        action="store_true",
+        help="Trade agent reasoning detail for faster steps"
+    )
+
     parser.add_argument(
         "--debug",
         action="store_true",
@@ -222,9 +526,70 @@ Examples:
 
     args = parser.parse_args()
 
-    # Run the async task
-    success = asyncio.run(run_browser_task(
-        task=args.task,
+    # Batch modes never start a browser, so flags that only affect one would be silently ignored
+    batch_mode = "--async-poll" if args.async_poll else "--async-submit" if args.async_submit else None
+    if batch_mode:
+        unused = {
+            "--url": args.url,
+            "--headless": args.headless,
+            "--screenshot": args.screenshot,
+            "--timeout": args.timeout is not None,
+            "--latency-optimized": args.latency_optimized,
+        }
+        if args.async_poll:
+            unused.update({
+                "a task argument": args.task,
+                "--stdin": args.stdin,
+                "--async-submit": args.async_submit,
+                "--model": args.model is not None,
+            })
+        for flag, given in unused.items():
+            if given:
+                parser.error(f"{flag} cannot be used with {batch_mode}")
+
+    if args.timeout is None:
+        args.timeout = DEFAULT_TIMEOUT
+    if args.model is None:
+        args.model = DEFAULT_MODEL
+
+    if args.async_poll:
+        tasks = []
+    elif args.stdin:
+        if args.task:
+            parser.error("a task argument cannot be combined with --stdin")
+        tasks = [line.strip() for line in sys.stdin if line.strip()]
+        if not tasks:
+            parser.error("no tasks read from stdin")
+    elif args.task:
+        tasks = [args.task]
+    else:
+        parser.error("the following arguments are required: task")
+
+    # Set up API key before loading browser-use
+    api_key = get_anthropic_api_key()
+    if not api_key:
+        print("Error: ANTHROPIC_API_KEY not found.", file=sys.stderr)
+        print("Set it via environment variable or add to keymanager.", file=sys.stderr)
+        sys.exit(1)
+
+    os.environ["ANTHROPIC_API_KEY"] = api_key
+
+    # Batch modes talk to the API directly and never start a browser
+    if args.async_poll:
+        sys.exit(0 if poll_batch(args.async_poll, args.output) else 1)
+    if args.async_submit:
+        sys.exit(0 if submit_batch(tasks, args.model, args.output) else 1)
+
+    # uvloop cuts per-await overhead for the agent's many CDP/HTTP round-trips
+    loop_factory = None
+    if sys.platform != "win32":
+        try:
+            import uvloop
+            loop_factory = uvloop.new_event_loop
+        except ImportError:
+            pass
+
+    task_kwargs = dict(
         url=args.url,
         headless=args.headless,
         screenshot_path=args.screenshot,
@@ -232,7 +597,14 @@ Examples:
         timeout=args.timeout,
         model=args.model,
         debug=args.debug,
-    ))
+        latency_optimized=args.latency_optimized,
+    )
+
+    # Run the async task
+    if args.stdin:
+        success = asyncio.run(run_stdin_tasks(tasks, **task_kwargs), loop_factory=loop_factory)
+    else:
+        success = asyncio.run(run_browser_task(task=args.task, **task_kwargs), loop_factory=loop_factory)
 
     sys.exit(0 if success else 1)
 
@@ -1,41 +1,163 @@
+import collections
 import json
 import os
+import queue
+import re
+import signal
+import sys
+import threading
 from datetime import datetime
 from mitmproxy import http
 
+try:
+    import orjson
+
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:
+    _loads = json.loads
+
+    def _dumps(obj):
+        return json.dumps(obj).encode()
+
 LOG_DIR = os.path.join(os.path.dirname(__file__), "..", "logs")
 os.makedirs(LOG_DIR, exist_ok=True)
 LOG_FILE = os.path.join(LOG_DIR, f"api-requests-{int(datetime.now().timestamp())}.jsonl")
 
-def request(flow: http.HTTPFlow) -> None:
-    if "anthropic" in flow.request.host or "claude" in flow.request.host:
-        entry = {
-            "timestamp": datetime.now().isoformat(),
-            "method": flow.request.method,
-            "url": flow.request.url,
-            "headers": dict(flow.request.headers),
-        }
-        
-        if flow.request.content:
+# One buffered handle is kept open between the load and done hooks instead of reopening per flow
+_LOG_FH = None
+BATCH_SIZE = 256
+# Rotate to LOG_FILE + ".1" past this size so appends stay within the page cache
+MAX_LOG_BYTES = 256 << 20
+_bytes_written = 0
+
+# Entries are written by a background thread so the mitmproxy event loop never blocks on disk
+_Q = queue.SimpleQueue()
+
+
+def _rotate():
+    global _LOG_FH, _bytes_written
+    _LOG_FH.close()
+    os.replace(LOG_FILE, LOG_FILE + ".1")
+    _LOG_FH = open(LOG_FILE, "ab", buffering=1 << 20)
+    _bytes_written = 0
+
+
+def _writer():
+    global _bytes_written
+    while True:
+        batch = [_Q.get()]
+        while len(batch) < BATCH_SIZE:
             try:
-                body = json.loads(flow.request.content.decode())
-                entry["body"] = body
-                
-                if "system" in body:
-                    print("\n" + "="*80)
-                    print("SYSTEM PROMPT:")
-                    print("="*80)
-                    if isinstance(body["system"], list):
-                        for item in body["system"]:
-                            if isinstance(item, dict) and "text" in item:
-                                print(item["text"][:2000] + "..." if len(item["text"]) > 2000 else item["text"])
-                    else:
-                        print(body["system"][:2000] + "..." if len(str(body["system"])) > 2000 else body["system"])
-                    print("="*80 + "\n")
-            except:
-                entry["body"] = flow.request.content.decode()
-        
-        with open(LOG_FILE, "a") as f:
-            f.write(json.dumps(entry) + "\n")
-        
-        print(f"[{entry['timestamp']}] {flow.request.method} {flow.request.url}")
+                batch.append(_Q.get_nowait())
+            except queue.Empty:
+                break
+        done = None in batch
+        lines = [line for line in batch if line is not None]
+        # Keep draining on write errors (e.g. disk full) so the queue can't grow without bound
+        if lines:
+            try:
+                _LOG_FH.writelines(lines)
+                _LOG_FH.flush()
+                _bytes_written += sum(map(len, lines))
+                if not done and _bytes_written >= MAX_LOG_BYTES:
+                    _rotate()
+            except (OSError, ValueError) as e:
+                print(f"log-requests: dropped {len(lines)} log entries: {e}", file=sys.stderr)
+        if done:
+            return
+
+
+_WRITER = None
+
+
+# mitmproxy re-executes the script on reload and calls done() on the old copy, so the
+# writer thread and file handle live between these hooks rather than for the whole process
+def load(loader):
+    global _LOG_FH, _WRITER, _bytes_written
+    _LOG_FH = open(LOG_FILE, "ab", buffering=1 << 20)
+    _bytes_written = 0
+    _WRITER = threading.Thread(target=_writer, name="log-requests-writer", daemon=True)
+    _WRITER.start()
+
+
+def done():
+    _Q.put(None)
+    _WRITER.join(timeout=5)
+    if _WRITER.is_alive():
+        # Closing the handle under a still-running writer would race it; leave both to process exit
+        print("log-requests: writer did not stop in time; some entries may be lost", file=sys.stderr)
+        return
+    _LOG_FH.close()
+
+
+_HOST_RE = re.compile(r"anthropic|claude").search
+_now = datetime.now
+PREVIEW_CHARS = 2000
+# Headers worth keeping in the log; everything else (including credentials) is dropped
+_KEEP_HEADERS = frozenset({"content-type", "x-request-id", "anthropic-version", "anthropic-beta", "user-agent"})
+
+# System prompts are kept in memory instead of printed per request; send SIGUSR1 to dump them
+_RECENT = collections.deque(maxlen=64)
+
+
+def _dump_recent(*_):
+    out = []
+    for ts, url, preview in list(_RECENT):
+        out.append("\n" + "="*80)
+        out.append(f"SYSTEM PROMPT: [{ts}] {url}")
+        out.append("="*80)
+        out.extend(preview)
+        out.append("="*80 + "\n")
+    sys.stderr.write("\n".join(out) + "\n")
+    sys.stderr.flush()
+
+
+if hasattr(signal, "SIGUSR1"):
+    signal.signal(signal.SIGUSR1, _dump_recent)
+
+
+def request(flow: http.HTTPFlow) -> None:
+    req = flow.request
+    if not _HOST_RE(req.host):
+        return
+    method = req.method
+    url = req.url
+
+    ts = _now().isoformat(timespec="microseconds")
+    entry = {
+        "timestamp": ts,
+        "method": method,
+        "url": url,
+        "headers": {k: v for k, v in req.headers.items() if k.lower() in _KEEP_HEADERS},
+    }
+    
+    content = req.content
+    # Only requests carrying a system prompt are worth a full JSON parse
+    if content and b'"system"' not in content:
+        entry["body"] = content.decode("utf-8", "replace")
+    elif content:
+        try:
+            body = _loads(content)
+        except ValueError:
+            entry["body"] = content.decode("utf-8", "replace")
+        else:
+            entry["body"] = body
+
+            if isinstance(body, dict) and "system" in body:
+                system = body["system"]
+                if isinstance(system, list):
+                    preview = []
+                    for item in system:
+                        if isinstance(item, dict) and "text" in item:
+                            text = item["text"]
+                            preview.append(text[:PREVIEW_CHARS] + "..." if len(text) > PREVIEW_CHARS else text)
+                elif isinstance(system, str):
+                    preview = [system[:PREVIEW_CHARS] + "..." if len(system) > PREVIEW_CHARS else system]
+                else:
+                    preview = [str(system)]
+                _RECENT.append((ts, url, preview))
+    
+    _Q.put(_dumps(entry) + b"\n")
+    
+    print(f"[{ts}] {method} {url}")
@@ -11,6 +11,7 @@ echo "  export HTTPS_PROXY=http://localhost:8080"
 echo "  export HTTP_PROXY=http://localhost:8080"
 echo "  claude"
 echo ""
+echo "Recent system prompts: kill -USR1 <mitmdump pid>"
 echo "Press Ctrl+C to stop"
 echo ""
 